@@ -1,7 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import Request
-from pipeline import run_ai_analysis
+from fastapi import Request, HTTPException
+from fastapi.responses import Response, JSONResponse
+from pipeline import run_ai_analysis, get_topic_config, TOPICS
+import asyncio
+import hmac
+import os
+import profiling
+import result_cache
 
 app = FastAPI()
 
@@ -11,8 +17,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "Cache-Control"],
 )
 
+# Debug endpoints are disabled unless DEBUG_TOKEN is set, and then require it in X-Debug-Token
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+TOPIC_NAMES = {t["name"] for t in TOPICS}
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    if DEBUG_TOKEN:
+        app.state.loop_lag_task = asyncio.create_task(profiling.monitor_loop_lag())
+
+def require_debug_token(request: Request):
+    token = request.headers.get("x-debug-token", "")
+    if not DEBUG_TOKEN or not hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode()):
+        raise HTTPException(status_code=404)
+
+async def run_profiled_analysis(topic_name: str, source: str) -> str:
+    # Only actual pipeline runs are traced and sampled, never cache hits or 304s
+    with profiling.AnalysisCapture(source, topic_name):
+        return await run_ai_analysis(topic_name)
+
+def clamp_seconds(seconds: float) -> float:
+    return min(max(seconds, 0.1), profiling.MAX_PROFILE_SECONDS)
+
 @app.get("/")
 def root():
     return {"message": "AI Trend Analyzer Backend is running."}
@@ -21,5 +50,82 @@ def root():
 async def analyze(request: Request):
     data = await request.json()
     topic = data.get('topic', 'AI & Machine Learning')
-    result = await run_ai_analysis(topic)
-    return {"result": result} 
\ No newline at end of file
+    result = await run_profiled_analysis(topic, "POST /analyze")
+    if topic == get_topic_config(topic)["name"]:
+        result_cache.store(topic, result)
+    return {"result": result}
+
+@app.get("/analysis/{topic}")
+async def get_analysis(topic: str, request: Request):
+    if topic not in TOPIC_NAMES:
+        raise HTTPException(status_code=404, detail=f"Unknown topic: {topic}")
+    entry, error = await result_cache.get_or_refresh(topic, lambda: run_profiled_analysis(topic, "GET /analysis refresh"))
+
+    if entry is None:
+        # The pipeline failed and there is no earlier result; never let anything cache the error
+        return JSONResponse(
+            {"error": error},
+            status_code=503,
+            headers={"Cache-Control": "no-store", "Retry-After": str(result_cache.RETRY_AFTER_FAILURE_SECONDS)},
+        )
+
+    headers = {
+        "ETag": entry.etag,
+        "Last-Modified": entry.last_modified,
+        "Cache-Control": entry.cache_control(),
+        "Vary": "Accept-Encoding",
+    }
+    if result_cache.etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+
+    encoding = result_cache.choose_encoding(request.headers.get("accept-encoding"), entry.encoded)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=entry.encoded[encoding], media_type="application/json", headers=headers)
+
+@app.get("/debug/profile/wall")
+async def debug_profile_wall(request: Request, seconds: float = 10, interval_ms: float = 10):
+    require_debug_token(request)
+    profile = await profiling.sample_wall_clock(clamp_seconds(seconds), max(interval_ms, 1) / 1000)
+    return JSONResponse(profile, headers={"Content-Disposition": 'attachment; filename="wall.speedscope.json"'})
+
+@app.get("/debug/profile/cpu")
+async def debug_profile_cpu(request: Request, seconds: float = 10):
+    require_debug_token(request)
+    stats = await profiling.profile_cpu(clamp_seconds(seconds))
+    if stats is None:
+        raise HTTPException(status_code=409, detail="A CPU profile is already running.")
+    return Response(
+        content=stats,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="cpu.pstats"'},
+    )
+
+@app.get("/debug/tasks")
+async def debug_tasks(request: Request):
+    require_debug_token(request)
+    return {"tasks": profiling.dump_tasks()}
+
+@app.get("/debug/loop-lag")
+async def debug_loop_lag(request: Request):
+    require_debug_token(request)
+    return profiling.loop_lag_stats()
+
+@app.get("/debug/slow-analyses")
+async def debug_slow_analyses(request: Request):
+    require_debug_token(request)
+    return {
+        "threshold_seconds": profiling.SLOW_REQUEST_THRESHOLD_SECONDS,
+        "analyses": profiling.slow_analyses(),
+    }
+
+@app.get("/debug/slow-analyses/{capture_id}/profile")
+async def debug_slow_analysis_profile(capture_id: int, request: Request):
+    require_debug_token(request)
+    capture = profiling.get_slow_analysis(capture_id)
+    if capture is None or capture.sampler is None:
+        raise HTTPException(status_code=404, detail="No profile for that analysis.")
+    return JSONResponse(
+        capture.sampler.to_speedscope(),
+        headers={"Content-Disposition": f'attachment; filename="analysis-{capture_id}.speedscope.json"'},
+    )
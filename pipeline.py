@@ -16,6 +16,9 @@ import os
 import asyncio
 import time
 import logging
+from uuid import uuid4
+
+import profiling
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -160,12 +163,19 @@ def get_topic_config(topic_name):
 
 APP_NAME = "ai_analysis_pipeline"
 USER_ID = "colab_user"
-SESSION_ID = "ai_analysis_session"
 
 session_service = InMemorySessionService()
 
-async def ensure_session():
-    await session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID)
+# Each run gets its own session: runs can overlap (one refresh per topic), and a
+# shared session would mix their event history and output_key state.
+async def ensure_session(session_id):
+    await session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+
+async def discard_session(session_id):
+    try:
+        await session_service.delete_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    except Exception as e:
+        logger.warning(f"[Pipeline] Could not delete session {session_id}: {str(e)}")
 
 
 def log_event(event):
@@ -175,23 +185,26 @@ def log_final_response(response):
     print("[Pipeline] Final response from pipeline:")
     print(response)
 
-def exa_search_ai(topic_name: str) -> dict:
+def _exa_search_ai(topic_name: str) -> dict:
     logger.info(f"[Tool] exa_search_ai called with topic: {topic_name}")
     topic = get_topic_config(topic_name)
     try:
-        results = Exa(api_key=os.getenv("EXA_API_KEY")).search_and_contents(
-            query=topic["exa_query"],
-            include_domains=topic.get("exa_domains", []),
-            num_results=10,
-            text=True,
-            type="auto",
-            highlights={"highlights_per_url": 2, "num_sentences": 3},
-            start_published_date=(datetime.now() - timedelta(days=30)).isoformat()
-        )
+        with profiling.stage("exa:search"):
+            results = Exa(api_key=os.getenv("EXA_API_KEY")).search_and_contents(
+                query=topic["exa_query"],
+                include_domains=topic.get("exa_domains", []),
+                num_results=10,
+                text=True,
+                type="auto",
+                highlights={"highlights_per_url": 2, "num_sentences": 3},
+                start_published_date=(datetime.now() - timedelta(days=30)).isoformat()
+            )
         
+        with profiling.stage("exa:to_dict"):
+            payload = [r.__dict__ for r in results.results]
         return {
             "type": "exa",
-            "results": [r.__dict__ for r in results.results]
+            "results": payload
         }
     except Exception as e:
         logger.error(f"[Tool] exa_search_ai failed for {topic_name}: {str(e)}")
@@ -201,17 +214,18 @@ def exa_search_ai(topic_name: str) -> dict:
             "results": []
         }
 
-def tavily_search_ai_analysis(topic_name: str) -> dict:
+def _tavily_search_ai_analysis(topic_name: str) -> dict:
     logger.info(f"[Tool] tavily_search_ai_analysis called with topic: {topic_name}")
     topic = get_topic_config(topic_name)
     try:
         client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-        response = client.search(
-            query=topic["tavily_query"],
-            search_depth="advanced",
-            time_range="week",
-            include_domains=topic["tavily_domains"]
-        )
+        with profiling.stage("tavily:search"):
+            response = client.search(
+                query=topic["tavily_query"],
+                search_depth="advanced",
+                time_range="week",
+                include_domains=topic["tavily_domains"]
+            )
        
         return {
             "type": "tavily",
@@ -225,16 +239,17 @@ def tavily_search_ai_analysis(topic_name: str) -> dict:
             "results": []
         }
 
-def firecrawl_scrape_topic(topic_name: str) -> dict:
+def _firecrawl_scrape_topic(topic_name: str) -> dict:
     logger.info(f"[Tool] firecrawl_scrape_topic called with topic: {topic_name}")
     topic = get_topic_config(topic_name)
     firecrawl = FirecrawlApp(api_key=os.getenv("FIRECRAWL_API_KEY"))
     try:
-        scrape_result = firecrawl.scrape_url(
-            url=topic["firecrawl_url"],
-            formats=["markdown"],
-            only_main_content=True
-        )
+        with profiling.stage("firecrawl:scrape"):
+            scrape_result = firecrawl.scrape_url(
+                url=topic["firecrawl_url"],
+                formats=["markdown"],
+                only_main_content=True
+            )
         if scrape_result.success:
           
             return {
@@ -254,13 +269,27 @@ def firecrawl_scrape_topic(topic_name: str) -> dict:
             "error": str(e)
         }
 
+# The search SDKs are blocking, so the tools handed to the agents run them on a
+# worker thread to keep the event loop free while a pipeline is in flight.
+async def exa_search_ai(topic_name: str) -> dict:
+    return await asyncio.to_thread(_exa_search_ai, topic_name)
+
+async def tavily_search_ai_analysis(topic_name: str) -> dict:
+    return await asyncio.to_thread(_tavily_search_ai_analysis, topic_name)
+
+async def firecrawl_scrape_topic(topic_name: str) -> dict:
+    return await asyncio.to_thread(_firecrawl_scrape_topic, topic_name)
+
 async def run_ai_analysis(topic_name="AI & Machine Learning") -> str:
     start_time = time.time()
     logger.info(f"[Pipeline] Starting analysis for topic: {topic_name}")
+    session_id = uuid4().hex
     
     try:
         topic = get_topic_config(topic_name)
-        await ensure_session()
+        session_start = time.time()
+        await ensure_session(session_id)
+        profiling.record_stage("ensure_session", time.time() - session_start)
 
         # Create agents with timing and error handling
         exa_start = time.time()
@@ -386,14 +415,20 @@ You are an analyst specializing in the latest trends and statistics.
         execution_start = time.time()
         try:
             content = types.Content(role="user", parts=[types.Part(text=topic_name)])
-            events = runner.run(user_id=USER_ID, session_id=SESSION_ID, new_message=content)
+            events = runner.run_async(user_id=USER_ID, session_id=session_id, new_message=content)
             
             last_response = None
             agent_start_times = {}
             agent_completion_times = {}
+            last_event_time = execution_start
             
-            for event in events:
+            async for event in events:
                 try:
+                    # Record the wait for each event (LLM round-trips, tool calls) in the trace
+                    event_time = time.time()
+                    profiling.record_stage(f"event:{getattr(event, 'author', None)}", event_time - last_event_time)
+                    last_event_time = event_time
+
                     # Track agent start times
                     if hasattr(event, 'author') and event.author:
                         if event.author not in agent_start_times:
@@ -410,6 +445,7 @@ You are an analyst specializing in the latest trends and statistics.
                     logger.error(f"[Pipeline] Error processing event: {str(e)}")
             
             execution_time = time.time() - execution_start
+            profiling.record_stage("execute_pipeline", execution_time)
             logger.info(f"[Pipeline] Total execution time: {execution_time:.2f}s")
             
             # Log final agent completion times
@@ -417,6 +453,7 @@ You are an analyst specializing in the latest trends and statistics.
                 logger.info("[Pipeline] Agent completion times:")
                 for agent, timing in agent_completion_times.items():
                     logger.info(f"  - {agent}: {timing:.2f}s")
+                    profiling.record_stage(f"agent:{agent}", timing)
             
             if last_response:
                 total_time = time.time() - start_time
@@ -433,4 +470,6 @@ You are an analyst specializing in the latest trends and statistics.
     except Exception as e:
         total_time = time.time() - start_time
         logger.error(f"[Pipeline] Analysis failed after {total_time:.2f}s: {str(e)}")
-        return f"Analysis failed: {str(e)}" 
\ No newline at end of file
+        return f"Analysis failed: {str(e)}"
+    finally:
+        await discard_session(session_id) 
\ No newline at end of file
@@ -0,0 +1,307 @@
+import asyncio
+import contextlib
+import contextvars
+import cProfile
+import io
+import itertools
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Analyses slower than this keep their sampled profile and stage trace
+SLOW_REQUEST_THRESHOLD_SECONDS = float(os.getenv("SLOW_REQUEST_THRESHOLD_SECONDS", "30"))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", "10"))
+SLOW_REQUEST_PROFILING = os.getenv("SLOW_REQUEST_PROFILING", "1") == "1"
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "10")) / 1000
+# Bounds the memory of one sampler: recording stops once this many samples
+# (after merging repeats) are kept across all threads
+MAX_SAMPLES = int(os.getenv("PROFILE_MAX_SAMPLES", "10000"))
+MAX_STACK_DEPTH = 128
+MAX_PROFILE_SECONDS = 300
+LOOP_LAG_INTERVAL_SECONDS = 0.5
+
+
+class StackSampler:
+    """Samples the Python stacks of every thread from a background thread.
+
+    This measures wall-clock time: a thread blocked in I/O or idling in the
+    event loop's select() shows up in the samples just like one burning CPU.
+    Samples are kept per thread, so the loop thread and the worker threads
+    running the blocking search SDKs each get their own profile. Frames and
+    whole stacks are interned, so a sample costs one stack id and a weight;
+    after max_samples the sampler stops recording and marks itself truncated.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL_SECONDS, name="profile", max_samples=MAX_SAMPLES):
+        self.interval = interval
+        self.name = name
+        self.max_samples = max_samples
+        self.frames = []
+        self._frame_index = {}
+        self.stacks = []
+        self._stack_index = {}
+        self.threads = {}
+        self.sample_count = 0
+        self.truncated = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+        self.stopped_at = None
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+            index = self._frame_index.get(key)
+            if index is None:
+                index = len(self.frames)
+                self._frame_index[key] = index
+                self.frames.append({"name": key[0], "file": key[1], "line": key[2]})
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        stack = tuple(stack)
+        stack_id = self._stack_index.get(stack)
+        if stack_id is None:
+            stack_id = len(self.stacks)
+            self._stack_index[stack] = stack_id
+            self.stacks.append(stack)
+        return stack_id
+
+    def _record(self, thread_id, thread_name, stack_id, weight):
+        thread = self.threads.get(thread_id)
+        if thread is None:
+            thread = self.threads[thread_id] = {"name": thread_name, "samples": [], "weights": []}
+        if thread["samples"] and thread["samples"][-1] == stack_id:
+            thread["weights"][-1] += weight
+        elif not self.truncated:
+            thread["samples"].append(stack_id)
+            thread["weights"].append(weight)
+            self.sample_count += 1
+            self.truncated = self.sample_count >= self.max_samples
+
+    def _run(self):
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval) and not self.truncated:
+            now = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self._record(thread_id, names.get(thread_id, str(thread_id)), self._stack(frame), now - last)
+            frame = None  # don't keep the last sampled frame (and its locals) alive
+            last = now
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name=f"sampler-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.stopped_at = time.time()
+        return self
+
+    def to_speedscope(self):
+        profiles = []
+        for thread_id, thread in self.threads.items():
+            if not thread["samples"]:
+                continue
+            profiles.append({
+                "type": "sampled",
+                "name": f"{thread['name']} ({thread_id})",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(thread["weights"]),
+                "samples": [list(self.stacks[i]) for i in thread["samples"]],
+                "weights": thread["weights"],
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name + (" (truncated)" if self.truncated else ""),
+            "exporter": "trend-analyzer-backend",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.frames},
+            "profiles": profiles,
+        }
+
+
+_profile_lock = threading.Lock()
+
+
+async def sample_wall_clock(seconds, interval=SAMPLE_INTERVAL_SECONDS):
+    """Sample all threads for `seconds` and return a speedscope profile."""
+    sampler = StackSampler(interval, name=f"wall-{seconds}s").start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    return sampler.to_speedscope()
+
+
+async def profile_cpu(seconds):
+    """Run cProfile on the event loop thread for `seconds` and return a marshalled pstats dump.
+
+    cProfile only hooks the thread that enables it, so work the tools hand to
+    worker threads is not included; use the wall-clock sampler for that.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        profiler.create_stats()
+        return marshal.dumps(profiler.stats)
+    finally:
+        _profile_lock.release()
+
+
+def dump_tasks():
+    tasks = []
+    for task in asyncio.all_tasks():
+        buffer = io.StringIO()
+        task.print_stack(file=buffer)
+        coro = task.get_coro()
+        tasks.append({
+            "name": task.get_name(),
+            "coro": getattr(coro, "__qualname__", repr(coro)),
+            "done": task.done(),
+            "stack": buffer.getvalue(),
+        })
+    return tasks
+
+
+# --- Event loop lag ---
+
+_loop_lag = deque(maxlen=600)
+
+
+async def monitor_loop_lag():
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+        lag = time.perf_counter() - start - LOOP_LAG_INTERVAL_SECONDS
+        _loop_lag.append((time.time(), max(0.0, lag)))
+
+
+def loop_lag_stats():
+    lags = sorted(lag for _, lag in _loop_lag)
+    if not lags:
+        return {"samples": 0}
+    return {
+        "samples": len(lags),
+        "interval_seconds": LOOP_LAG_INTERVAL_SECONDS,
+        "max_seconds": lags[-1],
+        "p50_seconds": lags[len(lags) // 2],
+        "p99_seconds": lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+        "recent": [{"at": at, "lag_seconds": lag} for at, lag in list(_loop_lag)[-20:]],
+    }
+
+
+# --- Per-analysis stage traces and slow-analysis capture ---
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_slow_analyses = deque(maxlen=SLOW_REQUEST_BUFFER_SIZE)
+_active_captures = set()
+_capture_ids = itertools.count(1)
+
+
+def record_stage(name, duration, **details):
+    """Attach a stage timing to the trace of the analysis currently running, if any.
+
+    The trace lives in a ContextVar, so it follows the pipeline into tasks it
+    spawns and into asyncio.to_thread workers, but not into bare threads.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append({"stage": name, "at": time.time(), "duration_seconds": duration, **details})
+
+
+@contextlib.contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+class AnalysisCapture:
+    """Traces and samples one pipeline run, keeping it if it turns out slow.
+
+    The sampler sees the whole process, so when several analyses run at once
+    their profiles overlap; such captures are flagged with overlapped=True.
+    """
+
+    def __init__(self, source, topic_name):
+        self.id = next(_capture_ids)
+        self.source = source
+        self.topic_name = topic_name
+        self.started_at = time.time()
+        self.duration = None
+        self.overlapped = False
+        self.trace = []
+        self.sampler = None
+
+    def __enter__(self):
+        self._token = _current_trace.set(self.trace)
+        self._start = time.perf_counter()
+        if _active_captures:
+            self.overlapped = True
+            for other in _active_captures:
+                other.overlapped = True
+        _active_captures.add(self)
+        if SLOW_REQUEST_PROFILING:
+            self.sampler = StackSampler(name=f"{self.source} {self.topic_name}").start()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self._start
+        if self.sampler is not None:
+            self.sampler.stop()
+        _active_captures.discard(self)
+        _current_trace.reset(self._token)
+        if self.duration >= SLOW_REQUEST_THRESHOLD_SECONDS:
+            _slow_analyses.append(self)
+            logger.warning(f"[Profiling] Slow analysis #{self.id} ({self.source}, {self.topic_name}) took {self.duration:.2f}s")
+        else:
+            self.sampler = None
+        return False
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "source": self.source,
+            "topic": self.topic_name,
+            "started_at": self.started_at,
+            "duration_seconds": self.duration,
+            "overlapped": self.overlapped,
+            "has_profile": self.sampler is not None,
+            "profile_truncated": self.sampler is not None and self.sampler.truncated,
+            "trace": self.trace,
+        }
+
+
+def slow_analyses():
+    return [c.summary() for c in reversed(_slow_analyses)]
+
+
+def get_slow_analysis(capture_id):
+    for c in _slow_analyses:
+        if c.id == capture_id:
+            return c
+    return None
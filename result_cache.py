@@ -0,0 +1,168 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from email.utils import formatdate
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; fall back to gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# How long a stored analysis is considered fresh before GET refreshes it in the background
+RESULT_TTL_SECONDS = int(os.getenv("ANALYSIS_RESULT_TTL_SECONDS", "1800"))
+# How long a CDN may keep serving a stale copy while we refresh in the background
+STALE_WHILE_REVALIDATE_SECONDS = int(os.getenv("ANALYSIS_STALE_WHILE_REVALIDATE_SECONDS", "300"))
+# After a failed refresh, keep serving the last good result this long before retrying
+RETRY_AFTER_FAILURE_SECONDS = int(os.getenv("ANALYSIS_RETRY_AFTER_FAILURE_SECONDS", "300"))
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+
+class CachedResult:
+    """One version of an analysis result, encoded and compressed once."""
+
+    def __init__(self, topic_name, result):
+        self.topic_name = topic_name
+        self.created_at = time.time()
+        self.body = json.dumps({"result": result}, ensure_ascii=False).encode("utf-8")
+        self.etag = 'W/"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.last_modified = formatdate(self.created_at, usegmt=True)
+        self.encoded = {"identity": self.body}
+        if len(self.body) >= MIN_COMPRESS_BYTES:
+            self.encoded["gzip"] = gzip.compress(self.body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.encoded["br"] = brotli.compress(self.body, quality=11)
+
+    def age(self):
+        return time.time() - self.created_at
+
+    def is_fresh(self):
+        return self.age() < RESULT_TTL_SECONDS
+
+    def cache_control(self):
+        max_age = max(0, int(RESULT_TTL_SECONDS - self.age()))
+        return f"public, max-age={max_age}, stale-while-revalidate={STALE_WHILE_REVALIDATE_SECONDS}"
+
+
+_results = {}
+_refreshes = {}
+_failures = {}
+
+
+def is_cacheable(result):
+    # run_ai_analysis reports failures as plain strings; never pin those in the cache
+    return bool(result) and not result.startswith("Analysis failed:") \
+        and result != "No final response from pipeline."
+
+
+def get(topic_name):
+    return _results.get(topic_name)
+
+
+def store(topic_name, result):
+    if not is_cacheable(result):
+        return None
+    entry = CachedResult(topic_name, result)
+    previous = _results.get(topic_name)
+    if previous is not None and previous.etag == entry.etag:
+        # Same content as before: keep the old version so clients' ETags and
+        # Last-Modified stay valid, but restart its freshness window
+        previous.created_at = entry.created_at
+        return previous
+    _results[topic_name] = entry
+    logger.info(f"[Cache] Stored new result for {topic_name} ({len(entry.body)} bytes, etag {entry.etag})")
+    return entry
+
+
+def _refresh(topic_name, compute):
+    """Start (or join) the single in-flight pipeline run for topic_name."""
+    task = _refreshes.get(topic_name)
+    if task is None or task.done():
+        task = asyncio.create_task(_run_refresh(topic_name, compute))
+        _refreshes[topic_name] = task
+    return task
+
+
+async def _run_refresh(topic_name, compute):
+    try:
+        result = await compute()
+    except Exception as e:
+        logger.error(f"[Cache] Refresh failed for {topic_name}: {str(e)}")
+        result = f"Analysis failed: {str(e)}"
+    if store(topic_name, result) is None:
+        _failures[topic_name] = (time.time(), result)
+        logger.warning(f"[Cache] Refresh for {topic_name} produced no cacheable result")
+    else:
+        _failures.pop(topic_name, None)
+    return result
+
+
+def _recently_failed(topic_name):
+    failure = _failures.get(topic_name)
+    return failure is not None and time.time() - failure[0] < RETRY_AFTER_FAILURE_SECONDS
+
+
+async def get_or_refresh(topic_name, compute):
+    """Return (entry, error) for topic_name.
+
+    A stored entry is always returned straight away; if it is stale a refresh
+    runs in the background. Only when nothing has been stored yet does the
+    caller wait for the pipeline, and error is then its failure message.
+    After a failed run the pipeline is not retried for RETRY_AFTER_FAILURE_SECONDS.
+    """
+    entry = _results.get(topic_name)
+    if entry is not None:
+        if not entry.is_fresh() and not _recently_failed(topic_name):
+            _refresh(topic_name, compute)
+        return entry, None
+    if not _recently_failed(topic_name):
+        # Shield so a poller disconnecting does not cancel the run others are waiting on
+        await asyncio.shield(_refresh(topic_name, compute))
+    entry = _results.get(topic_name)
+    if entry is not None:
+        return entry, None
+    return None, _failures.get(topic_name, (None, "Analysis failed."))[1]
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 13.1.2): ignore the W/ prefix on both sides
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding, available):
+    """Pick the best encoding from available that the client accepts."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
@@ -0,0 +1,118 @@
+import gzip
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import profiling
+import result_cache
+
+LONG_RESULT = "## Trends\n" + "- something new\n" * 100
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(monkeypatch):
+    monkeypatch.setattr(profiling, "SLOW_REQUEST_PROFILING", False)
+    result_cache._results.clear()
+    result_cache._refreshes.clear()
+    result_cache._failures.clear()
+    yield
+    result_cache._results.clear()
+    result_cache._refreshes.clear()
+    result_cache._failures.clear()
+
+
+@pytest.fixture
+def pipeline_calls(monkeypatch):
+    calls = []
+
+    async def fake_run_ai_analysis(topic_name):
+        calls.append(topic_name)
+        return LONG_RESULT
+
+    monkeypatch.setattr(main, "run_ai_analysis", fake_run_ai_analysis)
+    return calls
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def test_first_get_runs_pipeline_and_sets_cache_headers(client, pipeline_calls):
+    response = client.get("/analysis/Music", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.json() == {"result": LONG_RESULT}
+    assert response.headers["etag"].startswith('W/"')
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert "max-age=" in response.headers["cache-control"]
+    assert "last-modified" in response.headers
+    assert "content-encoding" not in response.headers
+    assert pipeline_calls == ["Music"]
+
+
+def test_matching_if_none_match_returns_304(client, pipeline_calls):
+    etag = client.get("/analysis/Music").headers["etag"]
+    response = client.get("/analysis/Music", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert pipeline_calls == ["Music"]
+
+
+def test_stale_if_none_match_returns_body(client, pipeline_calls):
+    response = client.get("/analysis/Music", headers={"If-None-Match": 'W/"outdated"'})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("accept, encoding", [
+    ("gzip", "gzip"),
+    pytest.param("br, gzip", "br", marks=pytest.mark.skipif(
+        result_cache.brotli is None, reason="brotli not installed")),
+])
+def test_compressed_responses(client, pipeline_calls, accept, encoding):
+    response = client.get("/analysis/Music", headers={"Accept-Encoding": accept})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == encoding
+    assert "Accept-Encoding" in response.headers["vary"]
+    # TestClient decodes the body transparently
+    assert response.json() == {"result": LONG_RESULT}
+
+
+def test_gzip_body_is_the_precomputed_one(client, pipeline_calls):
+    client.get("/analysis/Music")
+    entry = result_cache.get("Music")
+    assert json.loads(gzip.decompress(entry.encoded["gzip"])) == {"result": LONG_RESULT}
+
+
+def test_unknown_topic_returns_404(client, pipeline_calls):
+    response = client.get("/analysis/typo")
+    assert response.status_code == 404
+    assert pipeline_calls == []
+
+
+def test_failure_without_earlier_result_returns_503(client, monkeypatch):
+    async def failing_run_ai_analysis(topic_name):
+        return "Analysis failed: upstream down"
+
+    monkeypatch.setattr(main, "run_ai_analysis", failing_run_ai_analysis)
+    response = client.get("/analysis/Music")
+    assert response.status_code == 503
+    assert response.headers["cache-control"] == "no-store"
+    assert "retry-after" in response.headers
+    assert response.json() == {"error": "Analysis failed: upstream down"}
+
+
+def test_post_analyze_populates_cache(client, pipeline_calls):
+    response = client.post("/analyze", json={"topic": "Music"})
+    assert response.json() == {"result": LONG_RESULT}
+    assert client.get("/analysis/Music").status_code == 200
+    assert pipeline_calls == ["Music"]
+
+
+def test_debug_endpoints_hidden_without_valid_token(client, monkeypatch):
+    monkeypatch.setattr(main, "DEBUG_TOKEN", "secret")
+    assert client.get("/debug/loop-lag").status_code == 404
+    assert client.get("/debug/loop-lag", headers={"X-Debug-Token": "wrong"}).status_code == 404
+    assert client.get("/debug/loop-lag", headers={"X-Debug-Token": "secret"}).status_code == 200
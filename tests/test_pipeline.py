@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+import pipeline
+
+
+class FakeRunner:
+    """Stands in for the ADK Runner so no model or search API is called."""
+
+    session_ids = []
+
+    def __init__(self, agent, app_name, session_service):
+        self.session_service = session_service
+
+    async def run_async(self, user_id, session_id, new_message):
+        session = await self.session_service.get_session(
+            app_name=pipeline.APP_NAME, user_id=user_id, session_id=session_id
+        )
+        assert session is not None
+        FakeRunner.session_ids.append(session_id)
+        # Yield control so the two runs genuinely overlap
+        await asyncio.sleep(0.01)
+        text = new_message.parts[0].text
+        yield SimpleNamespace(
+            author="AnalysisAgent",
+            is_final_response=lambda: True,
+            content=SimpleNamespace(parts=[SimpleNamespace(text=f"analysis of {text}")]),
+        )
+
+
+def test_concurrent_runs_use_separate_sessions(monkeypatch):
+    FakeRunner.session_ids = []
+    monkeypatch.setattr(pipeline, "Runner", FakeRunner)
+
+    async def scenario():
+        return await asyncio.gather(
+            pipeline.run_ai_analysis("Music"),
+            pipeline.run_ai_analysis("Sports"),
+        )
+
+    results = asyncio.run(scenario())
+    assert results == ["analysis of Music", "analysis of Sports"]
+    assert len(FakeRunner.session_ids) == 2
+    assert FakeRunner.session_ids[0] != FakeRunner.session_ids[1]
+
+    async def leftover_sessions():
+        response = await pipeline.session_service.list_sessions(
+            app_name=pipeline.APP_NAME, user_id=pipeline.USER_ID
+        )
+        return response.sessions
+
+    assert asyncio.run(leftover_sessions()) == []
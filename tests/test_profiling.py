@@ -0,0 +1,158 @@
+import asyncio
+import marshal
+import sys
+import threading
+import time
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture(autouse=True)
+def clear_state(monkeypatch):
+    profiling._loop_lag.clear()
+    profiling._slow_analyses.clear()
+    profiling._active_captures.clear()
+    monkeypatch.setattr(profiling, "SLOW_REQUEST_THRESHOLD_SECONDS", 0.05)
+    yield
+    profiling._loop_lag.clear()
+    profiling._slow_analyses.clear()
+
+
+def _frame_names(profile, speedscope):
+    frames = speedscope["shared"]["frames"]
+    return {frames[i]["name"] for stack in profile["samples"] for i in stack}
+
+
+def test_speedscope_shape_and_worker_threads():
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    worker = threading.Thread(target=busy_worker, name="worker")
+    worker.start()
+    sampler = profiling.StackSampler(interval=0.005, name="test").start()
+    time.sleep(0.1)
+    sampler.stop()
+    stop.set()
+    worker.join()
+
+    data = sampler.to_speedscope()
+    assert data["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+    assert all({"name", "file", "line"} <= set(f) for f in data["shared"]["frames"])
+    by_name = {p["name"].split(" (")[0]: p for p in data["profiles"]}
+    assert "worker" in by_name and "MainThread" in by_name
+    assert not any(name.startswith("sampler-") for name in by_name)
+    for profile in data["profiles"]:
+        assert profile["type"] == "sampled" and profile["unit"] == "seconds"
+        assert len(profile["samples"]) == len(profile["weights"])
+        assert profile["endValue"] == pytest.approx(sum(profile["weights"]))
+        assert all(0 <= i < len(data["shared"]["frames"]) for s in profile["samples"] for i in s)
+    assert "busy_worker" in _frame_names(by_name["worker"], data)
+
+
+def test_sampler_merges_identical_consecutive_stacks():
+    sampler = profiling.StackSampler()
+    sampler._record(1, "t", 0, 0.01)
+    sampler._record(1, "t", 0, 0.02)
+    sampler._record(1, "t", 1, 0.01)
+    assert sampler.threads[1]["samples"] == [0, 1]
+    assert sampler.threads[1]["weights"] == pytest.approx([0.03, 0.01])
+
+
+def test_sampler_interns_stacks():
+    sampler = profiling.StackSampler()
+    frame = sys._getframe()
+    first = sampler._stack(frame)
+    assert sampler._stack(frame) == first
+    assert len(sampler.stacks) == 1
+    assert sampler.frames[sampler.stacks[first][-1]]["name"] == "test_sampler_interns_stacks"
+
+
+def test_sampler_stops_at_max_samples():
+    sampler = profiling.StackSampler(max_samples=3)
+    sampler.stacks = [(0,)] * 5
+    sampler.frames = [{"name": "f", "file": "f.py", "line": 1}]
+    for stack_id in range(5):
+        sampler._record(1, "t", stack_id, 0.01)
+    # Repeats of the last stack still add weight without a new sample
+    sampler._record(1, "t", 2, 0.01)
+    assert sampler.threads[1]["samples"] == [0, 1, 2]
+    assert sampler.truncated
+    assert sampler.to_speedscope()["name"].endswith("(truncated)")
+
+
+def test_sampler_thread_exits_when_truncated():
+    sampler = profiling.StackSampler(interval=0.001, max_samples=1).start()
+    sampler._thread.join(timeout=1)
+    assert not sampler._thread.is_alive()
+    sampler.stop()
+    assert sampler.truncated
+
+
+def test_loop_lag_stats_empty():
+    assert profiling.loop_lag_stats() == {"samples": 0}
+
+
+def test_loop_lag_stats_percentiles():
+    for i in range(100):
+        profiling._loop_lag.append((float(i), i / 1000))
+    stats = profiling.loop_lag_stats()
+    assert stats["samples"] == 100
+    assert stats["max_seconds"] == pytest.approx(0.099)
+    assert stats["p50_seconds"] == pytest.approx(0.050)
+    assert stats["p99_seconds"] == pytest.approx(0.099)
+    assert len(stats["recent"]) == 20
+
+
+def test_record_stage_without_capture_is_noop():
+    profiling.record_stage("orphan", 1.0)
+    with profiling.stage("orphan"):
+        pass
+
+
+def test_capture_keeps_slow_analyses_with_trace_from_worker_threads():
+    def blocking_call():
+        with profiling.stage("remote"):
+            time.sleep(0.06)
+
+    async def scenario():
+        with profiling.AnalysisCapture("test", "Music") as capture:
+            await asyncio.to_thread(blocking_call)
+        return capture
+
+    capture = asyncio.run(scenario())
+    summary = profiling.slow_analyses()[0]
+    assert summary["id"] == capture.id and summary["has_profile"]
+    assert [s["stage"] for s in summary["trace"]] == ["remote"]
+    assert profiling.get_slow_analysis(capture.id) is capture
+
+
+def test_capture_drops_fast_analyses(monkeypatch):
+    monkeypatch.setattr(profiling, "SLOW_REQUEST_THRESHOLD_SECONDS", 10)
+    with profiling.AnalysisCapture("test", "Music") as capture:
+        pass
+    assert profiling.slow_analyses() == []
+    assert capture.sampler is None
+
+
+def test_concurrent_captures_are_flagged_overlapped(monkeypatch):
+    monkeypatch.setattr(profiling, "SLOW_REQUEST_PROFILING", False)
+    with profiling.AnalysisCapture("a", "Music") as first:
+        with profiling.AnalysisCapture("b", "Sports") as second:
+            pass
+    assert first.overlapped and second.overlapped
+
+
+def test_profile_cpu_returns_loadable_stats_and_is_exclusive():
+    async def scenario():
+        running = asyncio.create_task(profiling.profile_cpu(0.05))
+        await asyncio.sleep(0)
+        assert await profiling.profile_cpu(0.01) is None
+        return await running
+
+    stats = marshal.loads(asyncio.run(scenario()))
+    assert isinstance(stats, dict)
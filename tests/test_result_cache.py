@@ -0,0 +1,189 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+import result_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    result_cache._results.clear()
+    result_cache._refreshes.clear()
+    result_cache._failures.clear()
+    yield
+    result_cache._results.clear()
+    result_cache._refreshes.clear()
+    result_cache._failures.clear()
+
+
+LONG_RESULT = "## Trends\n" + "- something new\n" * 100
+
+
+def test_cached_result_encodes_once():
+    entry = result_cache.CachedResult("Music", LONG_RESULT)
+    assert json.loads(entry.body) == {"result": LONG_RESULT}
+    assert gzip.decompress(entry.encoded["gzip"]) == entry.body
+    assert entry.etag.startswith('W/"') and entry.etag.endswith('"')
+
+
+def test_small_bodies_are_not_compressed():
+    entry = result_cache.CachedResult("Music", "short")
+    assert list(entry.encoded) == ["identity"]
+
+
+def test_etag_is_stable_for_same_content():
+    a = result_cache.CachedResult("Music", LONG_RESULT)
+    b = result_cache.CachedResult("Music", LONG_RESULT)
+    c = result_cache.CachedResult("Music", LONG_RESULT + "x")
+    assert a.etag == b.etag
+    assert a.etag != c.etag
+
+
+def test_cache_control_counts_down(monkeypatch):
+    entry = result_cache.CachedResult("Music", LONG_RESULT)
+    entry.created_at -= result_cache.RESULT_TTL_SECONDS - 60
+    assert "max-age=59" in entry.cache_control() or "max-age=60" in entry.cache_control()
+    entry.created_at -= 120
+    assert "max-age=0," in entry.cache_control()
+    assert not entry.is_fresh()
+
+
+@pytest.mark.parametrize("result, cacheable", [
+    (LONG_RESULT, True),
+    ("", False),
+    (None, False),
+    ("Analysis failed: timeout", False),
+    ("No final response from pipeline.", False),
+])
+def test_is_cacheable(result, cacheable):
+    assert result_cache.is_cacheable(result) is cacheable
+
+
+def test_store_deduplicates_identical_results():
+    first = result_cache.store("Music", LONG_RESULT)
+    first.created_at -= 100
+    first.last_modified = "Mon, 19 Oct 2026 10:00:00 GMT"
+    second = result_cache.store("Music", LONG_RESULT)
+    assert second is first
+    assert first.age() < 100
+    assert first.last_modified == "Mon, 19 Oct 2026 10:00:00 GMT"
+
+
+def test_store_replaces_changed_results():
+    first = result_cache.store("Music", LONG_RESULT)
+    second = result_cache.store("Music", LONG_RESULT + "more")
+    assert second is not first
+    assert result_cache.get("Music") is second
+
+
+def test_store_rejects_failures():
+    assert result_cache.store("Music", "Analysis failed: boom") is None
+    assert result_cache.get("Music") is None
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ("", False),
+    ("*", True),
+    ('W/"abc"', True),
+    ('"abc"', True),
+    ('"other", W/"abc"', True),
+    ('"other"', False),
+])
+def test_etag_matches(header, matches):
+    assert result_cache.etag_matches(header, 'W/"abc"') is matches
+
+
+ALL_ENCODINGS = {"identity": b"", "gzip": b"", "br": b""}
+
+
+@pytest.mark.parametrize("header, available, expected", [
+    (None, ALL_ENCODINGS, "identity"),
+    ("gzip, deflate, br", ALL_ENCODINGS, "br"),
+    ("gzip, br;q=0", ALL_ENCODINGS, "gzip"),
+    ("br", {"identity": b"", "gzip": b""}, "identity"),
+    ("*", {"identity": b"", "gzip": b""}, "gzip"),
+    ("*, gzip;q=0", ALL_ENCODINGS, "br"),
+    ("gzip;q=bogus", ALL_ENCODINGS, "identity"),
+    ("identity", ALL_ENCODINGS, "identity"),
+])
+def test_choose_encoding(header, available, expected):
+    assert result_cache.choose_encoding(header, available) == expected
+
+
+def test_get_or_refresh_waits_only_without_entry():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return LONG_RESULT
+
+    async def scenario():
+        entry, error = await result_cache.get_or_refresh("Music", compute)
+        assert error is None and entry.topic_name == "Music"
+        again, _ = await result_cache.get_or_refresh("Music", compute)
+        assert again is entry
+
+    asyncio.run(scenario())
+    assert calls == [1]
+
+
+def test_get_or_refresh_serves_stale_and_refreshes_in_background():
+    stale = result_cache.store("Music", LONG_RESULT)
+    stale.created_at -= result_cache.RESULT_TTL_SECONDS + 1
+    started = []
+
+    async def compute():
+        started.append(1)
+        await asyncio.sleep(0)
+        return LONG_RESULT + "fresh"
+
+    async def scenario():
+        entry, _ = await result_cache.get_or_refresh("Music", compute)
+        assert entry is stale
+        # A second poll while the refresh is in flight must not start another run
+        await result_cache.get_or_refresh("Music", compute)
+        await result_cache._refreshes["Music"]
+        fresh, _ = await result_cache.get_or_refresh("Music", compute)
+        assert fresh is not stale and fresh.is_fresh()
+
+    asyncio.run(scenario())
+    assert started == [1]
+
+
+def test_failed_refresh_keeps_last_good_entry_and_backs_off():
+    stale = result_cache.store("Music", LONG_RESULT)
+    stale.created_at -= result_cache.RESULT_TTL_SECONDS + 1
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return "Analysis failed: upstream down"
+
+    async def scenario():
+        await result_cache.get_or_refresh("Music", compute)
+        await result_cache._refreshes["Music"]
+        entry, error = await result_cache.get_or_refresh("Music", compute)
+        assert entry is stale and error is None
+
+    asyncio.run(scenario())
+    assert calls == [1]
+
+
+def test_failure_without_entry_reports_error_and_backs_off():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        entry, error = await result_cache.get_or_refresh("Music", compute)
+        assert entry is None and "boom" in error
+        entry, error = await result_cache.get_or_refresh("Music", compute)
+        assert entry is None and "boom" in error
+
+    asyncio.run(scenario())
+    assert calls == [1]